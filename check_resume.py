@@ -0,0 +1,80 @@
+# Crash/resume check for run_on_test_file_parallel
+# --------------------------------
+# Kills a parallel prediction run mid-way, leaves a torn partial write in the
+# output, resumes it, and checks the result matches an uninterrupted run.
+#
+# python check_resume.py
+
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+CHUNK_SIZE = 5
+WORKERS = 2
+ROWS = 400
+
+RUN = (
+    "import shl_recommender as s; "
+    "s.run_on_test_file_parallel({input!r}, {output!r}, "
+    "chunk_size={chunk_size}, workers={workers})"
+)
+
+
+def wait_for_checkpoint_then_kill(proc, checkpoint_path: str):
+    while proc.poll() is None:
+        if os.path.exists(checkpoint_path):
+            # Kill the whole process group so pool workers die too
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+            return
+        time.sleep(0.05)
+    raise RuntimeError("Run finished before it could be interrupted; raise ROWS")
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    input_path = os.path.join(tmp, "queries.csv")
+    crashed_path = os.path.join(tmp, "crashed.csv")
+    reference_path = os.path.join(tmp, "reference.csv")
+
+    roles = ["Java developer", "Sales graduate", "Data analyst",
+             "Customer support agent", "Project manager"]
+    pd.DataFrame({
+        "query": [f"{roles[i % len(roles)]} #{i}" for i in range(ROWS)]
+    }).to_csv(input_path, index=False)
+
+    proc = subprocess.Popen(
+        [sys.executable, "-c", RUN.format(input=input_path, output=crashed_path,
+                                          chunk_size=CHUNK_SIZE,
+                                          workers=WORKERS)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        start_new_session=True,
+    )
+    wait_for_checkpoint_then_kill(proc, crashed_path + ".ckpt.json")
+    print("Killed run after first checkpoint")
+
+    # Simulate a write that was cut off after the last checkpoint
+    with open(crashed_path, "a", encoding="utf-8") as f:
+        f.write("torn partial row,")
+
+    import shl_recommender as s
+    s.run_on_test_file_parallel(input_path, crashed_path,
+                                chunk_size=CHUNK_SIZE, workers=WORKERS)
+    s.run_on_test_file_parallel(input_path, reference_path,
+                                chunk_size=CHUNK_SIZE, workers=WORKERS)
+
+    resumed = pd.read_csv(crashed_path)
+    reference = pd.read_csv(reference_path)
+    assert len(resumed) == ROWS, f"expected {ROWS} rows, got {len(resumed)}"
+    pd.testing.assert_frame_equal(resumed, reference)
+    assert not os.path.exists(crashed_path + ".ckpt.json")
+    print("Resume check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# Ranking and catalog-index structures used by shl_recommender
+# --------------------------------
+# No model is loaded here: encoding and the scraped base catalog are passed
+# in by shl_recommender.
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+
+def mmr_rerank(scores, pool_similarity, k: int, mmr_lambda: float,
+               pool_size: int):
+    """Maximal Marginal Relevance over the top `pool_size` candidates.
+
+    `pool_similarity(pool)` returns the pool_size x pool_size slice of the
+    precomputed item-item similarities, so the cost is a few vector ops.
+    """
+    pool = np.argsort(scores)[-max(pool_size, k):][::-1]
+    relevance = scores[pool]
+    pool_sim = pool_similarity(pool)
+
+    selected = []
+    chosen = np.zeros(len(pool), dtype=bool)
+    max_sim = np.zeros(len(pool))
+    for step in range(min(k, len(pool))):
+        if step == 0:
+            mmr = relevance.copy()
+        else:
+            mmr = mmr_lambda * relevance - (1 - mmr_lambda) * max_sim
+        mmr[chosen] = -np.inf
+        best = int(np.argmax(mmr))
+        chosen[best] = True
+        selected.append(pool[best])
+        max_sim = pool_sim[best] if step == 0 else np.maximum(max_sim, pool_sim[best])
+    return selected
+
+
+# CATALOGS (per-tenant views over the shared base embeddings)
+
+def custom_record(item):
+    """Record for a tenant's custom assessment; ValueError says why it is unusable.
+
+    Unlike the scraped catalog, names containing "solution" are kept: tenants
+    curate these themselves.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("not an object")
+    fields = {}
+    for key in ("name", "url", "description"):
+        value = item.get(key)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"missing {key}")
+        fields[key] = value.strip()
+    return {
+        "name": fields["name"],
+        "url": fields["url"],
+        "text": f"{fields['name']}. {fields['description']}"
+    }
+
+
+class CatalogIndex:
+    """Assessments visible to one catalog.
+
+    Base assessments are referenced by position into the shared base records,
+    embeddings and item-item similarity; only tenant-specific custom
+    assessments carry their own embeddings and similarity rows.
+    """
+
+    def __init__(self, base_records, base_embeddings, base_similarity, base_idx,
+                 extra_records=(), extra_embeddings=None):
+        self.base_records = base_records
+        self.base_embeddings = base_embeddings
+        self.base_similarity = base_similarity
+        self.base_idx = np.asarray(base_idx, dtype=np.int64)
+        self.extra_records = list(extra_records)
+        self.extra_embeddings = extra_embeddings
+        self.extra_similarity = None
+        if self.extra_records:
+            # Rows for custom items against every catalog position
+            self.extra_similarity = np.hstack([
+                cosine_similarity(extra_embeddings, base_embeddings)[:, self.base_idx],
+                cosine_similarity(extra_embeddings),
+            ])
+
+    def __len__(self):
+        return len(self.base_idx) + len(self.extra_records)
+
+    @property
+    def nbytes(self):
+        size = self.base_idx.nbytes
+        if self.extra_records:
+            size += self.extra_embeddings.nbytes + self.extra_similarity.nbytes
+        return size
+
+    def record(self, i):
+        if i < len(self.base_idx):
+            return self.base_records[self.base_idx[i]]
+        return self.extra_records[i - len(self.base_idx)]
+
+    def score(self, query_emb):
+        scores = cosine_similarity(query_emb, self.base_embeddings)[0]
+        scores = scores[self.base_idx]
+        if self.extra_records:
+            extra = cosine_similarity(query_emb, self.extra_embeddings)[0]
+            scores = np.concatenate([scores, extra])
+        return scores
+
+    def pool_similarity(self, pool):
+        """Item-item similarity for the catalog positions in `pool`."""
+        pool = np.asarray(pool)
+        is_base = pool < len(self.base_idx)
+        base_pos = np.flatnonzero(is_base)
+        extra_pos = np.flatnonzero(~is_base)
+
+        sim = np.empty((len(pool), len(pool)))
+        base_ids = self.base_idx[pool[base_pos]]
+        sim[np.ix_(base_pos, base_pos)] = self.base_similarity[np.ix_(base_ids, base_ids)]
+        if len(extra_pos):
+            extra_rows = self.extra_similarity[pool[extra_pos] - len(self.base_idx)]
+            sim[extra_pos] = extra_rows[:, pool]
+            sim[np.ix_(base_pos, extra_pos)] = sim[np.ix_(extra_pos, base_pos)].T
+        return sim
+
+
+class CatalogRegistry:
+    """Builds tenant indexes on first use and evicts the least recently used
+    ones once their combined size exceeds the memory budget.
+
+    `specs` maps catalog ID to a definition such as::
+
+        {"include": ["<assessment name or url>", ...],
+         "custom": [{"name": ..., "url": ..., "description": ...}, ...]}
+
+    Omitting "include" exposes the whole base catalog. Specs are validated
+    once here; only the encoding of custom items is deferred to first use.
+    """
+
+    def __init__(self, specs, base_records, base_embeddings, base_similarity,
+                 encode, default_id: str, budget_mb: float):
+        self.default_id = default_id
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._base = (base_records, base_embeddings, base_similarity)
+        self._encode = encode
+        # The default catalog is pinned and never counts against the budget
+        self.default = CatalogIndex(*self._base, np.arange(len(base_records)))
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._base_lookup = {}
+        for i, r in enumerate(base_records):
+            self._base_lookup.setdefault(r["name"].lower(), i)
+            self._base_lookup.setdefault(r["url"], i)
+
+        self._plans = {}
+        self._invalid = {}
+        for catalog_id, spec in specs.items():
+            if catalog_id == default_id:
+                print(f"Catalog ID {default_id!r} is reserved for the full "
+                      "catalog; its definition is ignored")
+                continue
+            try:
+                self._plans[catalog_id] = self._plan(catalog_id, spec)
+            except ValueError as e:
+                print(e)
+                self._invalid[catalog_id] = str(e)
+
+    def get(self, catalog_id: str):
+        if catalog_id == self.default_id:
+            return self.default
+        if catalog_id in self._invalid:
+            raise ValueError(self._invalid[catalog_id])
+        if catalog_id not in self._plans:
+            raise KeyError(f"Unknown catalog: {catalog_id}")
+        with self._lock:
+            if catalog_id in self._loaded:
+                self._loaded.move_to_end(catalog_id)
+                return self._loaded[catalog_id]
+            build_lock = self._build_locks.setdefault(catalog_id, threading.Lock())
+
+        # Build outside the registry lock so other tenants are not blocked;
+        # the per-catalog lock stops concurrent duplicate builds
+        with build_lock:
+            with self._lock:
+                if catalog_id in self._loaded:
+                    self._loaded.move_to_end(catalog_id)
+                    return self._loaded[catalog_id]
+            index = self._build(catalog_id)
+            with self._lock:
+                self._loaded[catalog_id] = index
+                self._evict()
+            return index
+
+    def _plan(self, catalog_id: str, spec):
+        """Resolve a spec to (base positions, custom records), reporting misses."""
+        if not isinstance(spec, dict):
+            raise ValueError(f"Catalog {catalog_id} definition must be an object")
+
+        if "include" in spec:
+            base_idx = []
+            for ref in spec["include"]:
+                i = None
+                if isinstance(ref, str):
+                    ref = ref.strip()
+                    i = self._base_lookup.get(ref, self._base_lookup.get(ref.lower()))
+                if i is None:
+                    print(f"[{catalog_id}] unknown assessment skipped: {ref}")
+                else:
+                    base_idx.append(i)
+            base_idx = sorted(set(base_idx))
+        else:
+            base_idx = list(range(len(self._base[0])))
+
+        extra_records = []
+        for item in spec.get("custom", []):
+            try:
+                extra_records.append(custom_record(item))
+            except ValueError as e:
+                print(f"[{catalog_id}] custom assessment rejected ({e}): {item!r}")
+
+        if not base_idx and not extra_records:
+            raise ValueError(f"Catalog {catalog_id} has no valid assessments")
+        return base_idx, extra_records
+
+    def _build(self, catalog_id: str):
+        base_idx, extra_records = self._plans[catalog_id]
+        extra_embeddings = None
+        if extra_records:
+            extra_embeddings = np.asarray(
+                self._encode([r["text"] for r in extra_records])
+            )
+
+        index = CatalogIndex(*self._base, base_idx, extra_records, extra_embeddings)
+        print(f"Loaded catalog {catalog_id}: {len(index)} assessments")
+        return index
+
+    def _evict(self):
+        # Always keep the most recently used index, even if it alone is over budget
+        while (len(self._loaded) > 1
+               and sum(i.nbytes for i in self._loaded.values()) > self.budget_bytes):
+            evicted, _ = self._loaded.popitem(last=False)
+            print(f"Evicted catalog {evicted}")
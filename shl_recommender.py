@@ -3,43 +3,62 @@
 # Prerequisites:
 # pip install sentence-transformers scikit-learn fastapi uvicorn pandas beautifulsoup4 requests
 
+import contextlib
+import hashlib
 import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
+import torch
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 from fastapi import FastAPI
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import requests
 from bs4 import BeautifulSoup
 
+from retrieval import CatalogRegistry, mmr_rerank
+
 
 # CONFIG
 
 DATA_PATH = "assessments_all.json"  # your scraped file (519 items)
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 TOP_K = 10
+MMR_LAMBDA = 0.7      # 1.0 = pure relevance, 0.0 = pure diversity
+MMR_POOL_SIZE = 50    # candidates considered for MMR re-ranking
+CACHE_DIR = ".cache"  # encoded embeddings, shared (memory-mapped) by workers
+CATALOGS_PATH = "catalogs.json"  # per-tenant catalog definitions (optional)
+DEFAULT_CATALOG = "default"      # the full scraped catalog
+CATALOG_MEMORY_BUDGET_MB = 64    # cap for lazily loaded tenant indexes
 
 # LOAD DATA
 
 with open(DATA_PATH, "r", encoding="utf-8") as f:
     data = json.load(f)
 
-# Keep only required fields and clean text
-records = []
-for item in data:
+
+def clean_record(item):
+    """Keep only required fields and clean text; None if the item is unusable."""
     name = item.get("name", "").strip()
     if "solution" in name.lower():
-        continue
+        return None
     url = item.get("url", "").strip()
     desc = item.get("description", "").strip()
     if name and url and desc:
-        records.append({
+        return {
             "name": name,
             "url": url,
             "text": f"{name}. {desc}"
-        })
-        
+        }
+    return None
+
+
+records = [r for r in map(clean_record, data) if r is not None]
 
 print(f"Loaded {len(records)} assessments")
 
@@ -48,7 +67,45 @@ print(f"Loaded {len(records)} assessments")
 
 model = SentenceTransformer(MODEL_NAME)
 assessment_texts = [r["text"] for r in records]
-assessment_embeddings = model.encode(assessment_texts, show_progress_bar=True)
+
+
+def embeddings_cache_key(texts):
+    """Identifies the model plus catalog texts the embeddings were built from."""
+    return hashlib.sha1(
+        "\n".join([MODEL_NAME] + texts).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+def load_or_encode_embeddings(texts, key):
+    """Encode `texts` once and cache them as .npy; later loads are memory-mapped
+    so prediction workers share the same pages instead of re-encoding."""
+    cache_path = os.path.join(CACHE_DIR, f"embeddings_{key}.npy")
+    if not os.path.exists(cache_path):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        embeddings = model.encode(texts, show_progress_bar=True)
+        tmp_path = cache_path + ".tmp.npy"
+        np.save(tmp_path, embeddings)
+        os.replace(tmp_path, cache_path)
+    return np.load(cache_path, mmap_mode="r")
+
+
+assessment_embeddings_key = embeddings_cache_key(assessment_texts)
+assessment_embeddings = load_or_encode_embeddings(assessment_texts,
+                                                  assessment_embeddings_key)
+
+# Item-item cosine similarity, cached once for MMR re-ranking
+item_similarity = cosine_similarity(assessment_embeddings)
+
+
+# CATALOGS (per-tenant views over the shared base embeddings)
+
+catalog_specs = {}
+if os.path.exists(CATALOGS_PATH):
+    with open(CATALOGS_PATH, "r", encoding="utf-8") as f:
+        catalog_specs = json.load(f)
+catalogs = CatalogRegistry(catalog_specs, records, assessment_embeddings,
+                           item_similarity, model.encode, DEFAULT_CATALOG,
+                           CATALOG_MEMORY_BUDGET_MB)
 
 
 
@@ -65,16 +122,24 @@ def extract_text_from_url(url: str) -> str:
         return ""
 
 
-def recommend(query_text: str, k: int = TOP_K):
+def recommend(query_text: str, k: int = TOP_K, diversify: bool = False,
+              mmr_lambda: float = MMR_LAMBDA,
+              catalog_id: str = DEFAULT_CATALOG):
+    index = catalogs.get(catalog_id)
     query_emb = model.encode([query_text])
-    scores = cosine_similarity(query_emb, assessment_embeddings)[0]
-    top_idx = np.argsort(scores)[-k:][::-1]
+    scores = index.score(query_emb)
+    if diversify:
+        top_idx = mmr_rerank(scores, index.pool_similarity, k, mmr_lambda,
+                             MMR_POOL_SIZE)
+    else:
+        top_idx = np.argsort(scores)[-k:][::-1]
 
     results = []
     for i in top_idx:
+        record = index.record(i)
         results.append({
-            "assessment_name": records[i]["name"],
-            "url": records[i]["url"],
+            "assessment_name": record["name"],
+            "url": record["url"],
             "score": float(scores[i])
         })
     return results
@@ -84,8 +149,10 @@ def recommend(query_text: str, k: int = TOP_K):
 
 
 
-def recommend_for_query(query: str, k: int = TOP_K):
-    results = recommend(query, k)
+def recommend_for_query(query: str, k: int = TOP_K, diversify: bool = False,
+                        mmr_lambda: float = MMR_LAMBDA,
+                        catalog_id: str = DEFAULT_CATALOG):
+    results = recommend(query, k, diversify, mmr_lambda, catalog_id)
     return [r["assessment_name"] for r in results]
 
 
@@ -126,7 +193,170 @@ def run_on_test_file(test_file_path: str, output_csv_path: str):
     print(f"Predictions saved to {output_csv_path}")
 
 
-def evaluate_on_labeled_file(train_file_path: str, k: int = 10):
+def _init_worker(num_threads: int):
+    # One torch thread pool per worker would otherwise use every core each
+    torch.set_num_threads(num_threads)
+
+
+def _predict_chunk(queries, k: int = TOP_K, diversify: bool = False):
+    # Runs inside a spawned worker: model and embeddings are the worker's own
+    # module globals, with the embeddings memory-mapped from CACHE_DIR
+    return ["; ".join(recommend_for_query(q, k, diversify)) for q in queries]
+
+
+def _iter_chunks(test_file_path: str, chunk_size: int):
+    if test_file_path.endswith(".xlsx"):
+        # Excel cannot be streamed by pandas; slice after a single read
+        df = pd.read_excel(test_file_path)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+    else:
+        yield from pd.read_csv(
+            test_file_path,
+            encoding="latin1",
+            on_bad_lines="skip",
+            chunksize=chunk_size
+        )
+
+
+def _run_fingerprint(test_file_path: str, chunk_size: int, diversify: bool):
+    stat = os.stat(test_file_path)
+    return {
+        "input": os.path.abspath(test_file_path),
+        "input_size": stat.st_size,
+        "input_mtime": stat.st_mtime,
+        "chunk_size": chunk_size,
+        "diversify": diversify,
+        "top_k": TOP_K,
+        "mmr_lambda": MMR_LAMBDA,
+        "embeddings": assessment_embeddings_key,
+    }
+
+
+def _load_checkpoint(checkpoint_path: str, output_csv_path: str,
+                     fingerprint: dict):
+    fresh = {"run": fingerprint, "chunks_done": 0, "rows_done": 0,
+             "output_bytes": 0}
+    if not os.path.exists(checkpoint_path):
+        return fresh
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("run") != fingerprint:
+        raise ValueError(
+            f"Checkpoint {checkpoint_path} was written for a different input "
+            "or settings; delete it to start over"
+        )
+    if not os.path.exists(output_csv_path):
+        print(f"Output {output_csv_path} missing, restarting from scratch")
+        return fresh
+    if os.path.getsize(output_csv_path) < state["output_bytes"]:
+        # Truncating would pad with NUL bytes rather than trim a torn tail
+        raise ValueError(
+            f"Output {output_csv_path} is shorter than checkpoint {checkpoint_path} "
+            "records; delete both to start over"
+        )
+    return state
+
+
+def _save_checkpoint(checkpoint_path: str, state: dict):
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def run_on_test_file_parallel(test_file_path: str, output_csv_path: str,
+                              chunk_size: int = 1000,
+                              workers: int | None = None,
+                              diversify: bool = False,
+                              checkpoint_path: str | None = None):
+    """Chunked, multi-process version of run_on_test_file.
+
+    Chunks are scored in a process pool and appended to the output in input
+    order. After every written chunk a checkpoint records progress, so a
+    rerun after a crash resumes where it stopped; the checkpoint is bound
+    to the input file, chunk_size, diversify, TOP_K, MMR_LAMBDA and the
+    model/catalog embeddings, and a mismatch is refused.
+
+    Workers always use the "spawn" start method: forking after torch and the
+    tokenizer have started threads can deadlock. Each worker re-imports this
+    module, so it loads its own model, memory-maps the embeddings the parent
+    cached in CACHE_DIR and rebuilds item_similarity and the catalog registry.
+    """
+    cores = os.cpu_count() or 1
+    workers = workers or cores
+    checkpoint_path = checkpoint_path or output_csv_path + ".ckpt.json"
+    fingerprint = _run_fingerprint(test_file_path, chunk_size, diversify)
+    state = _load_checkpoint(checkpoint_path, output_csv_path, fingerprint)
+
+    if state["chunks_done"]:
+        print(f"Resuming after {state['rows_done']} rows "
+              f"({state['chunks_done']} chunks)")
+        # Drop anything written after the last checkpoint
+        with open(output_csv_path, "r+b") as f:
+            f.truncate(state["output_bytes"])
+    elif os.path.exists(output_csv_path):
+        os.remove(output_csv_path)
+
+    start_time = time.time()
+    resumed_rows = state["rows_done"]
+    query_col = None
+    pending = deque()
+
+    def write_next():
+        chunk, future = pending.popleft()
+        chunk = chunk.copy()
+        chunk["recommended_assessments"] = future.result()
+        with open(output_csv_path, "a", encoding="utf-8", newline="") as f:
+            chunk.to_csv(f, index=False, header=state["chunks_done"] == 0)
+            state["output_bytes"] = f.tell()
+        state["chunks_done"] += 1
+        state["rows_done"] += len(chunk)
+        _save_checkpoint(checkpoint_path, state)
+
+        elapsed = time.time() - start_time
+        rate = (state["rows_done"] - resumed_rows) / elapsed if elapsed else 0.0
+        print(f"{state['rows_done']} rows done ({rate:.1f} rows/s)")
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(max(1, cores // workers),)) as pool:
+        for i, chunk in enumerate(_iter_chunks(test_file_path, chunk_size)):
+            if query_col is None:
+                print("Columns found:", chunk.columns.tolist())
+                query_col = find_query_column(chunk)
+                print("Using query column:", query_col)
+            if i < state["chunks_done"]:
+                continue
+
+            queries = chunk[query_col].astype(str).tolist()
+            future = pool.submit(_predict_chunk, queries, TOP_K, diversify)
+            pending.append((chunk, future))
+            # Bound in-flight chunks so the input is never fully materialised
+            if len(pending) >= 2 * workers:
+                write_next()
+
+        while pending:
+            write_next()
+
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(checkpoint_path)
+    print(f"Predictions saved to {output_csv_path}")
+
+
+def _assessment_key(label: str) -> str:
+    # Catalog URLs differ in prefix (/solutions/products/... vs /products/...),
+    # so URLs are compared by their final slug
+    label = label.strip().lower()
+    if label.startswith("http"):
+        return label.rstrip("/").rsplit("/", 1)[-1]
+    return label
+
+
+def evaluate_on_labeled_file(train_file_path: str, k: int = 10,
+                             diversify: bool = False,
+                             mmr_lambda: float = MMR_LAMBDA):
 
     # Load correctly
     if train_file_path.endswith(".xlsx"):
@@ -143,36 +373,44 @@ def evaluate_on_labeled_file(train_file_path: str, k: int = 10):
 
     query_col = find_query_column(df)
 
-    # Identify ground truth column automatically
+    # Identify ground truth column automatically: URL labels first, then names
     gt_col = None
-    for col in df.columns:
-        if "recommend" in col.lower():
-            gt_col = col
+    for hint in ("url", "recommend"):
+        for col in df.columns:
+            if col != query_col and hint in col.lower():
+                gt_col = col
+                break
+        if gt_col is not None:
             break
 
     if gt_col is None:
         print("No ground truth column found")
         return
+    print("Using ground truth column:", gt_col)
+
+    # Each query may span several rows, one (or more ";"-separated) label each
+    df[query_col] = df[query_col].ffill()
+    df = df.dropna(subset=[query_col, gt_col])
+    label_is_url = df[gt_col].astype(str).str.strip().str.startswith("http").any()
+    truth = {}
+    for query, labels in zip(df[query_col].astype(str), df[gt_col].astype(str)):
+        truth.setdefault(query, set()).update(
+            _assessment_key(x) for x in labels.split(";") if x.strip()
+        )
 
-    hits = 0
-    total = 0
-
-    for _, row in df.iterrows():
-        query = str(row[query_col])
-
-        true_assessments = [
-            x.strip().lower()
-            for x in str(row[gt_col]).split(";")
-        ]
-
-        preds = recommend_for_query(query, k)
-        preds = [p.lower() for p in preds]
-
-        if any(t in preds for t in true_assessments):
-            hits += 1
-        total += 1
+    recalls = []
+    for query, true_keys in truth.items():
+        results = recommend(query, k, diversify, mmr_lambda)
+        pred_keys = {
+            _assessment_key(r["url"] if label_is_url else r["assessment_name"])
+            for r in results
+        }
+        recalls.append(len(pred_keys & true_keys) / len(true_keys))
 
-    print(f"Recall@{k}: {hits/total:.2f}")
+    recall = sum(recalls) / len(recalls)
+    mode = f"MMR lambda={mmr_lambda}" if diversify else "top-k"
+    print(f"Mean Recall@{k} ({mode}) over {len(recalls)} queries: {recall:.3f}")
+    return recall
 
 
 
@@ -184,10 +422,20 @@ app = FastAPI(title="SHL Assessment Recommender")
 class QueryInput(BaseModel):
     query: str | None = None
     url: str | None = None
+    diversify: bool = False
+    mmr_lambda: float = Field(MMR_LAMBDA, ge=0.0, le=1.0)
+    catalog_id: str = DEFAULT_CATALOG
 
 
 @app.post("/recommend")
 def recommend_api(payload: QueryInput):
+    try:
+        catalogs.get(payload.catalog_id)
+    except KeyError:
+        return {"error": f"Unknown catalog: {payload.catalog_id}"}
+    except ValueError as e:
+        return {"error": str(e)}
+
     if payload.url and payload.url.strip():
 
         text = extract_text_from_url(payload.url)
@@ -199,7 +447,9 @@ def recommend_api(payload: QueryInput):
     else:
         return {"error": "Provide either query or url"}
 
-    results = recommend(query_text, k=TOP_K)
+    results = recommend(query_text, k=TOP_K, diversify=payload.diversify,
+                        mmr_lambda=payload.mmr_lambda,
+                        catalog_id=payload.catalog_id)
 
     # Return ONLY required fields in tabular-friendly format
     return {
@@ -221,6 +471,9 @@ if __name__ == "__main__":
 )
     
     evaluate_on_labeled_file("Gen_AI Dataset.xlsx", k=10)
+    for lam in (0.5, 0.7, 0.9):
+        evaluate_on_labeled_file("Gen_AI Dataset.xlsx", k=10,
+                                 diversify=True, mmr_lambda=lam)
 
 
 
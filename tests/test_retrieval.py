@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from retrieval import CatalogRegistry, mmr_rerank
+
+
+def random_similarity(n, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, 8))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors @ vectors.T
+
+
+def test_mmr_lambda_one_matches_plain_top_k():
+    scores = np.random.default_rng(1).random(40)
+    similarity = random_similarity(40)
+
+    ranked = mmr_rerank(scores, lambda pool: similarity[np.ix_(pool, pool)],
+                        k=10, mmr_lambda=1.0, pool_size=20)
+
+    assert list(ranked) == list(np.argsort(scores)[-10:][::-1])
+
+
+def test_mmr_demotes_near_duplicates():
+    scores = np.array([0.90, 0.89, 0.80])
+    similarity = np.array([
+        [1.00, 0.99, 0.10],
+        [0.99, 1.00, 0.10],
+        [0.10, 0.10, 1.00],
+    ])
+
+    ranked = mmr_rerank(scores, lambda pool: similarity[np.ix_(pool, pool)],
+                        k=3, mmr_lambda=0.5, pool_size=3)
+
+    assert list(ranked) == [0, 2, 1]
+
+
+def test_mmr_returns_each_item_once_when_k_exceeds_catalog():
+    scores = np.array([0.3, 0.1, 0.2])
+    similarity = np.eye(3)
+
+    ranked = mmr_rerank(scores, lambda pool: similarity[np.ix_(pool, pool)],
+                        k=10, mmr_lambda=0.7, pool_size=50)
+
+    assert sorted(ranked) == [0, 1, 2]
+
+
+def unit_vectors(n, seed):
+    vectors = np.random.default_rng(seed).normal(size=(n, 8))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_registry(specs, budget_mb=64.0, n_base=6):
+    base_records = [
+        {"name": f"Base {i}", "url": f"https://example.com/base-{i}/", "text": ""}
+        for i in range(n_base)
+    ]
+    base_embeddings = unit_vectors(n_base, seed=2)
+    encode_calls = []
+
+    def encode(texts):
+        encode_calls.append(list(texts))
+        return unit_vectors(len(texts), seed=len(encode_calls) + 10)
+
+    registry = CatalogRegistry(specs, base_records, base_embeddings,
+                               base_embeddings @ base_embeddings.T, encode,
+                               "default", budget_mb)
+    return registry, encode_calls
+
+
+def custom(name):
+    return {"name": name, "url": f"https://example.com/{name}/",
+            "description": f"{name} description"}
+
+
+def test_pool_similarity_mixes_base_and_custom_items():
+    registry, _ = make_registry({
+        "acme": {"include": ["Base 1", "https://example.com/base-4/", "base 3"],
+                 "custom": [custom("A"), custom("B")]}
+    })
+    index = registry.get("acme")
+    assert len(index) == 5
+
+    pool = np.array([3, 0, 4, 2, 1])
+    sim = index.pool_similarity(pool)
+
+    vectors = np.vstack([registry.default.base_embeddings[index.base_idx],
+                         index.extra_embeddings])
+    expected = (vectors @ vectors.T)[np.ix_(pool, pool)]
+    np.testing.assert_allclose(sim, expected, atol=1e-9)
+    np.testing.assert_allclose(sim, sim.T, atol=1e-9)
+    np.testing.assert_allclose(np.diag(sim), 1.0, atol=1e-9)
+
+
+def test_least_recently_used_catalog_is_evicted_first():
+    specs = {name: {"custom": [custom(name)]} for name in ("a", "b", "c")}
+    registry, _ = make_registry(specs)
+    registry.get("a")
+    registry.budget_bytes = 2 * registry.get("a").nbytes
+
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+
+    assert list(registry._loaded) == ["a", "c"]
+
+
+def test_tiny_budget_keeps_only_the_last_catalog():
+    specs = {name: {"custom": [custom(name)]} for name in ("a", "b")}
+    registry, _ = make_registry(specs, budget_mb=0)
+
+    registry.get("a")
+    index = registry.get("b")
+
+    assert list(registry._loaded) == ["b"]
+    assert registry.get("b") is index
+
+
+def test_custom_solution_items_are_kept_and_rejections_reported(capsys):
+    registry, _ = make_registry({
+        "acme": {"include": [],
+                 "custom": [custom("Graduate Solution Pack"),
+                            {"name": "No URL", "description": "x"}]}
+    })
+
+    index = registry.get("acme")
+
+    assert [index.record(i)["name"] for i in range(len(index))] == [
+        "Graduate Solution Pack"
+    ]
+    assert "custom assessment rejected (missing url)" in capsys.readouterr().out
+
+
+def test_invalid_catalogs_fail_fast_without_encoding():
+    registry, encode_calls = make_registry({
+        "empty": {"include": ["nope"], "custom": [{"name": "x"}]},
+        "broken": ["not", "a", "dict"],
+    })
+
+    for catalog_id in ("empty", "broken"):
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                registry.get(catalog_id)
+    assert encode_calls == []
+
+
+def test_reserved_default_id_is_ignored_with_warning(capsys):
+    registry, _ = make_registry({"default": {"include": ["Base 0"]}})
+
+    assert "reserved" in capsys.readouterr().out
+    assert len(registry.get("default")) == 6